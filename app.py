@@ -3,21 +3,27 @@
 GitHub Sentinel - Gradio Web UI 入口
 """
 
+import atexit
+import functools
 import logging
 import logging.handlers
+import os
+import queue
 import re
-import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime, timezone
 from pathlib import Path
 
 import gradio as gr
 
 from config import load_config
-from subscription import SubscriptionManager
+from subscription import SubscriptionManager, parse_repo_arg
 from github_client import GitHubClient
-from llm import LLMReporter, list_ollama_models
+from llm import LLMReporter, ResponseCache, list_ollama_models
 from notifier import FileNotifier
 from scheduler import SentinelScheduler
+from utils import atomic_write
 
 # --------------------------------------------------------------------------- #
 # 日志配置（与 main.py 相同，共享同一日志文件）
@@ -40,37 +46,69 @@ _console_handler = logging.StreamHandler()
 _console_handler.setLevel(logging.WARNING)
 _console_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
 
-logging.basicConfig(level=logging.DEBUG, handlers=[_file_handler, _console_handler])
+# 日志调用方只做内存入队，文件滚动与写入由后台监听线程完成
+_log_queue = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, _file_handler, _console_handler, respect_handler_level=True
+)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logging.basicConfig(level=logging.DEBUG, handlers=[logging.handlers.QueueHandler(_log_queue)])
 logger = logging.getLogger("sentinel.app")
 
 # --------------------------------------------------------------------------- #
 # 全局配置与调度器状态
 # --------------------------------------------------------------------------- #
 config = load_config()
+_sub_manager = SubscriptionManager(config["subscriptions_file"])
 
 _scheduler_obj: "SentinelScheduler | None" = None
-_scheduler_thread: "threading.Thread | None" = None
+
+_YIELD_INTERVAL = 0.1  # run_and_stream 高频进度推送的最小间隔（秒）
+
+_RE_REPO_CHOICE = re.compile(r'\(([^/]+)/([^)]+)\)\s*$')
 
 
 # --------------------------------------------------------------------------- #
 # 工具函数
 # --------------------------------------------------------------------------- #
 
-def parse_repo_arg(arg: str):
-    """解析 owner/repo 或完整 GitHub URL，返回 (owner, repo) 或 None"""
-    arg = arg.strip()
-    match = re.search(r"github\.com/([^/]+)/([^/\s]+)", arg)
-    if match:
-        return match.group(1), match.group(2).rstrip("/")
-    parts = arg.strip("/").split("/")
-    if len(parts) == 2 and all(parts):
-        return parts[0], parts[1]
-    return None
+@functools.lru_cache(maxsize=1)
+def _get_github_client() -> GitHubClient:
+    # 进程内共享，复用 requests.Session 的连接池与 ETag 缓存
+    return GitHubClient(config["github"]["token"], cache_dir=config["report"]["output_dir"])
+
+
+@functools.lru_cache(maxsize=8)
+def _get_reporter(provider: str, model: str, base_url: str) -> LLMReporter:
+    # 按 (provider, model, base_url) 复用 LLM 客户端及其连接池
+    llm_cfg = config["llm"]
+    cache = ResponseCache(
+        os.path.join(config["report"]["output_dir"], ".llm_cache"),
+        ttl=int(llm_cfg.get("cache_ttl_hours", 24) * 3600),
+    )
+    skip_empty = bool(llm_cfg.get("skip_empty", True))
+    if provider == "ollama":
+        return LLMReporter(
+            provider="ollama",
+            model=model,
+            max_tokens=llm_cfg["max_tokens"],
+            base_url=base_url,
+            cache=cache,
+            skip_empty=skip_empty,
+        )
+    return LLMReporter(
+        provider="deepseek",
+        api_key=llm_cfg["api_key"],
+        model=model,
+        max_tokens=llm_cfg["max_tokens"],
+        cache=cache,
+        skip_empty=skip_empty,
+    )
 
 
 def _build_components(provider: str = None, model: str = None, ollama_base_url: str = None):
-    sub_manager = SubscriptionManager(config["subscriptions_file"])
-    gh_client = GitHubClient(config["github"]["token"])
     llm_cfg = config["llm"]
 
     actual_provider = provider or llm_cfg.get("provider", "deepseek")
@@ -78,23 +116,13 @@ def _build_components(provider: str = None, model: str = None, ollama_base_url:
     if actual_provider == "ollama":
         actual_model = model or llm_cfg.get("ollama_model", "llama3.2")
         actual_base_url = ollama_base_url or llm_cfg.get("ollama_base_url", "http://localhost:11434")
-        reporter = LLMReporter(
-            provider="ollama",
-            model=actual_model,
-            max_tokens=llm_cfg["max_tokens"],
-            base_url=actual_base_url,
-        )
+        reporter = _get_reporter("ollama", actual_model, actual_base_url)
     else:  # deepseek
         actual_model = model or llm_cfg.get("model", "deepseek-chat")
-        reporter = LLMReporter(
-            provider="deepseek",
-            api_key=llm_cfg["api_key"],
-            model=actual_model,
-            max_tokens=llm_cfg["max_tokens"],
-        )
+        reporter = _get_reporter("deepseek", actual_model, "")
 
     notifier = FileNotifier(config["report"]["output_dir"])
-    return sub_manager, gh_client, reporter, notifier
+    return _sub_manager, _get_github_client(), reporter, notifier
 
 
 _ALL_REPOS = "全部（所有订阅仓库）"
@@ -102,8 +130,7 @@ _ALL_REPOS = "全部（所有订阅仓库）"
 
 def _get_repo_choices() -> list[str]:
     """返回仓库选择列表，格式：'标签 (owner/repo)'"""
-    sub_manager = SubscriptionManager(config["subscriptions_file"])
-    subs = sub_manager.list_subscriptions()
+    subs = _sub_manager.list_subscriptions()
     choices = [_ALL_REPOS] + [
         f"{s.get('label', s['owner'] + '/' + s['repo'])}  ({s['owner']}/{s['repo']})"
         for s in subs
@@ -115,7 +142,7 @@ def _parse_repo_choice(choice: str):
     """从 '标签 (owner/repo)' 格式解析出 (owner, repo)，返回 None 表示全部"""
     if not choice or choice == _ALL_REPOS:
         return None
-    m = re.search(r'\(([^/]+)/([^)]+)\)\s*$', choice)
+    m = _RE_REPO_CHOICE.search(choice)
     if m:
         return m.group(1).strip(), m.group(2).strip()
     return None
@@ -137,8 +164,7 @@ def _subs_to_rows(subs):
 
 
 def refresh_subscriptions():
-    sub_manager = SubscriptionManager(config["subscriptions_file"])
-    rows = _subs_to_rows(sub_manager.list_subscriptions())
+    rows = _subs_to_rows(_sub_manager.list_subscriptions())
     return rows
 
 
@@ -155,12 +181,8 @@ def add_subscription(repo_str: str, label: str, track_types: list):
         return "格式错误，请输入 owner/repo 或完整 GitHub URL", refresh_subscriptions(), _refresh_repo_dropdown()
     owner, repo = parsed
     track = track_types if track_types else ["releases", "issues", "pull_requests"]
-    sub_manager = SubscriptionManager(config["subscriptions_file"])
-    subs = sub_manager.list_subscriptions()
-    for s in subs:
-        if s["owner"] == owner and s["repo"] == repo:
-            return f"已存在：{owner}/{repo}", _subs_to_rows(subs), _refresh_repo_dropdown()
-    sub_manager.add_subscription(owner, repo, label=label.strip(), track=track)
+    if not _sub_manager.add_subscription(owner, repo, label=label.strip(), track=track):
+        return f"已存在：{owner}/{repo}", refresh_subscriptions(), _refresh_repo_dropdown()
     return f"已添加：{owner}/{repo}", refresh_subscriptions(), _refresh_repo_dropdown()
 
 
@@ -172,11 +194,7 @@ def remove_subscription(repo_str: str):
     if not parsed:
         return "格式错误，请输入 owner/repo 或完整 GitHub URL", refresh_subscriptions(), _refresh_repo_dropdown()
     owner, repo = parsed
-    sub_manager = SubscriptionManager(config["subscriptions_file"])
-    before = len(sub_manager.list_subscriptions())
-    sub_manager.remove_subscription(owner, repo)
-    after = len(sub_manager.list_subscriptions())
-    if after < before:
+    if _sub_manager.remove_subscription(owner, repo):
         return f"已移除：{owner}/{repo}", refresh_subscriptions(), _refresh_repo_dropdown()
     return f"未找到：{owner}/{repo}", refresh_subscriptions(), _refresh_repo_dropdown()
 
@@ -193,6 +211,17 @@ def run_and_stream(selected_repo: str, provider: str, model: str, ollama_base_ur
     log_lines = []
     combined_report = ""
 
+    # 抓取完成事件可能密集到达，按时间合并推送；阶段切换与耗时调用前的推送不受限制
+    last_yield = 0.0
+
+    def _yield_due() -> bool:
+        nonlocal last_yield
+        now = time.monotonic()
+        if now - last_yield < _YIELD_INTERVAL:
+            return False
+        last_yield = now
+        return True
+
     sub_manager, gh_client, reporter, notifier = _build_components(provider, model, ollama_base_url)
     all_subs = sub_manager.list_subscriptions()
 
@@ -201,8 +230,8 @@ def run_and_stream(selected_repo: str, provider: str, model: str, ollama_base_ur
     if parsed is None:
         subscriptions = all_subs
     else:
-        owner, repo = parsed
-        subscriptions = [s for s in all_subs if s["owner"] == owner and s["repo"] == repo]
+        sub = sub_manager.get_subscription(*parsed)
+        subscriptions = [sub] if sub else []
 
     if not subscriptions:
         yield "⚠ 订阅列表为空，请先在「订阅管理」中添加仓库", "", None
@@ -213,19 +242,52 @@ def run_and_stream(selected_repo: str, provider: str, model: str, ollama_base_ur
     log_lines.append(f"开始抓取 {scope} 的近 {days} 天更新...")
     yield "\n".join(log_lines), combined_report, None
 
-    all_updates = []
-    for sub in subscriptions:
-        label = sub.get("label", f"{sub['owner']}/{sub['repo']}")
-        log_lines.append(f"→ 正在获取 {label} ...")
+    results = {}
+    batch = None
+    if len(subscriptions) > 1:
+        # 多个仓库 → 合并为 GraphQL 批量查询，失败时退回逐个 REST 抓取
+        log_lines.append(f"→ 正在批量获取 {len(subscriptions)} 个仓库 ...")
         yield "\n".join(log_lines), combined_report, None
         try:
-            updates = gh_client.fetch_updates(sub, days=days)
-            all_updates.append(updates)
-            log_lines.append(f"  ✓ {label}：{len(updates['items'])} 条更新")
+            batch = gh_client.fetch_updates_batch(subscriptions, days=days)
         except Exception as e:
-            log_lines.append(f"  ✗ {label} 获取失败：{e}")
+            log_lines.append(f"  ✗ 批量获取失败，改为逐个获取：{e}")
+        if batch is not None:
+            for idx, (sub, updates) in enumerate(zip(subscriptions, batch)):
+                label = sub.get("label", f"{sub['owner']}/{sub['repo']}")
+                if updates is None:
+                    log_lines.append(f"  ✗ {label} 获取失败：仓库不存在或无访问权限")
+                else:
+                    results[idx] = updates
+                    log_lines.append(f"  ✓ {label}：{len(updates['items'])} 条更新")
         yield "\n".join(log_lines), combined_report, None
 
+    # 各仓库抓取互不依赖，并发提交，按完成顺序输出日志
+    if batch is None:
+        with ThreadPoolExecutor(max_workers=min(16, len(subscriptions))) as executor:
+            futures = {}
+            for idx, sub in enumerate(subscriptions):
+                label = sub.get("label", f"{sub['owner']}/{sub['repo']}")
+                log_lines.append(f"→ 正在获取 {label} ...")
+                futures[executor.submit(gh_client.fetch_updates, sub, days=days)] = (idx, label)
+            yield "\n".join(log_lines), combined_report, None
+
+            for future in as_completed(futures):
+                idx, label = futures[future]
+                try:
+                    updates = future.result()
+                    results[idx] = updates
+                    log_lines.append(f"  ✓ {label}：{len(updates['items'])} 条更新")
+                except Exception as e:
+                    log_lines.append(f"  ✗ {label} 获取失败：{e}")
+                if _yield_due():
+                    yield "\n".join(log_lines), combined_report, None
+
+        gh_client.save_etag_cache()  # 整轮抓取结束后落盘一次
+
+    # 保持与订阅列表一致的报告顺序
+    all_updates = [results[idx] for idx in sorted(results)]
+
     if not all_updates:
         log_lines.append("所有仓库获取失败，请检查 GitHub Token 和网络连接")
         yield "\n".join(log_lines), combined_report, None
@@ -234,23 +296,65 @@ def run_and_stream(selected_repo: str, provider: str, model: str, ollama_base_ur
     log_lines.append("\n正在调用 AI 生成摘要报告...")
     yield "\n".join(log_lines), combined_report, None
 
-    saved_paths = []
-    for updates in all_updates:
-        label = updates.get("label", f"{updates['owner']}/{updates['repo']}")
+    # 生成中的报告增量追加到 buffers[idx]（每个列表只由对应工作线程写入），主线程定期汇总推送
+    buffers = {}
+
+    def _generate_and_save(idx, updates, label):
+        buf = buffers[idx]
+
+        def _tee():
+            for delta in reporter.stream_report(updates):
+                buf.append(delta)
+                yield delta
+
+        # 增量同时用于界面展示与写入报告文件
         repo_slug = f"{updates['owner']}_{updates['repo']}"
-        log_lines.append(f"→ 正在为 {label} 生成报告...")
-        yield "\n".join(log_lines), combined_report, None
+        saved_path = notifier.send(_tee(), title=f"{label} 报告", repo_slug=repo_slug)
+        return "".join(buf), saved_path
 
-        try:
-            report = reporter.generate_report(updates)
-            saved_path = notifier.send(report, title=f"{label} 报告", repo_slug=repo_slug)
-            saved_paths.append(saved_path)
-            combined_report += f"# {label}\n\n{report}\n\n---\n\n"
-            log_lines.append(f"  ✓ {label} 报告已生成并保存")
-        except Exception as e:
-            log_lines.append(f"  ✗ {label} 报告生成失败：{e}")
+    # 各仓库报告并发流式生成，合并报告按订阅顺序排列
+    saved_paths = []
+    sections = {}
+    labels = {}
+    with ThreadPoolExecutor(max_workers=min(reporter.MAX_CONCURRENCY, len(all_updates))) as executor:
+        futures = {}
+        for idx, updates in enumerate(all_updates):
+            label = labels[idx] = updates.get("label", f"{updates['owner']}/{updates['repo']}")
+            buffers[idx] = []
+            log_lines.append(f"→ 正在为 {label} 生成报告...")
+            futures[executor.submit(_generate_and_save, idx, updates, label)] = idx
         yield "\n".join(log_lines), combined_report, None
 
+        pending = set(futures)
+        streamed = 0
+        while pending:
+            done, pending = wait(pending, timeout=_YIELD_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx = futures[future]
+                try:
+                    report, saved_path = future.result()
+                    saved_paths.append(saved_path)
+                    sections[idx] = f"# {labels[idx]}\n\n{report}\n\n---\n\n"
+                    log_lines.append(f"  ✓ {labels[idx]} 报告已生成并保存")
+                except Exception as e:
+                    log_lines.append(f"  ✗ {labels[idx]} 报告生成失败：{e}")
+                del buffers[idx]
+
+            total = sum(len(buf) for buf in buffers.values())
+            if not done and total == streamed:
+                continue
+            streamed = total
+            # 已完成的报告取最终内容，生成中的报告展示目前收到的部分
+            view = dict(sections)
+            for idx, buf in buffers.items():
+                if buf:
+                    view[idx] = f"# {labels[idx]}\n\n{''.join(buf)}\n\n"
+            combined_report = "".join(view[i] for i in sorted(view))
+            yield "\n".join(log_lines), combined_report, None
+
+    combined_parts = [sections[i] for i in sorted(sections)]
+    combined_report = "".join(combined_parts)
+
     log_lines.append("\n✅ 所有报告生成完成！")
 
     # 生成可供下载的文件
@@ -263,7 +367,7 @@ def run_and_stream(selected_repo: str, provider: str, model: str, ollama_base_ur
             ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
             output_dir = Path(config["report"]["output_dir"])
             digest_path = output_dir / f"digest_{ts}.md"
-            digest_path.write_text(combined_report, encoding="utf-8")
+            atomic_write(digest_path, combined_report.encode("utf-8"), fsync=True)
             download_path = str(digest_path)
             log_lines.append(f"合并报告已写入：{digest_path.name}")
 
@@ -274,12 +378,30 @@ def run_and_stream(selected_repo: str, provider: str, model: str, ollama_base_ur
 # Tab 3: 历史报告
 # --------------------------------------------------------------------------- #
 
+# 目录 mtime 未变化（无新增/删除文件）时直接复用上次的扫描结果
+_reports_cache = {"dir_mtime": None, "files": []}
+
+
 def list_reports() -> list[str]:
     output_dir = Path(config["report"]["output_dir"])
-    if not output_dir.exists():
+    try:
+        dir_mtime = output_dir.stat().st_mtime_ns
+    except FileNotFoundError:
         return []
-    files = sorted(output_dir.glob("*.md"), key=lambda p: p.stat().st_mtime, reverse=True)
-    return [str(f) for f in files]
+    if dir_mtime == _reports_cache["dir_mtime"]:
+        return list(_reports_cache["files"])
+
+    with os.scandir(output_dir) as it:
+        entries = [
+            (entry.stat().st_mtime, entry.path)
+            for entry in it
+            if entry.name.endswith(".md") and entry.is_file()
+        ]
+    entries.sort(reverse=True)
+    files = [path for _, path in entries]
+    _reports_cache["dir_mtime"] = dir_mtime
+    _reports_cache["files"] = files
+    return list(files)
 
 
 def refresh_report_list():
@@ -304,7 +426,7 @@ def view_report(file_path: str):
 # --------------------------------------------------------------------------- #
 
 def _scheduler_status() -> str:
-    if _scheduler_thread and _scheduler_thread.is_alive():
+    if _scheduler_obj is not None and _scheduler_obj.running:
         interval = config["scheduler"]["interval"]
         time_str = config["scheduler"]["time"]
         return f"✅ 运行中（{interval}，每次 {time_str}）"
@@ -319,8 +441,8 @@ def get_scheduler_info() -> tuple[str, str]:
 
 
 def start_scheduler():
-    global _scheduler_obj, _scheduler_thread
-    if _scheduler_thread and _scheduler_thread.is_alive():
+    global _scheduler_obj
+    if _scheduler_obj is not None and _scheduler_obj.running:
         return _scheduler_status()
 
     interval = config["scheduler"]["interval"]
@@ -330,8 +452,7 @@ def start_scheduler():
     )
 
     def _job():
-        _, gh_client, reporter, notifier = _build_components()
-        sub_manager = SubscriptionManager(config["subscriptions_file"])
+        sub_manager, gh_client, reporter, notifier = _build_components()
         days = 7 if interval == "weekly" else 1
         for sub in sub_manager.list_subscriptions():
             try:
@@ -342,19 +463,17 @@ def start_scheduler():
                 notifier.send(report, title=f"{label} 报告", repo_slug=repo_slug)
             except Exception as e:
                 logger.error("调度任务失败 %s/%s: %s", sub["owner"], sub["repo"], e)
+        gh_client.save_etag_cache()
 
-    _scheduler_thread = threading.Thread(
-        target=_scheduler_obj.start, args=(_job,), daemon=True
-    )
-    _scheduler_thread.start()
+    _scheduler_obj.start(_job)
     return _scheduler_status()
 
 
 def stop_scheduler():
-    global _scheduler_obj, _scheduler_thread
+    global _scheduler_obj
     if _scheduler_obj is not None:
         try:
-            _scheduler_obj._scheduler.shutdown(wait=False)
+            _scheduler_obj.shutdown()
         except Exception:
             pass
         _scheduler_obj = None
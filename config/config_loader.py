@@ -1,3 +1,5 @@
+import copy
+import functools
 import os
 import yaml
 from pathlib import Path
@@ -6,10 +8,17 @@ _BASE_DIR = Path(__file__).parent.parent
 
 
 def load_config(config_path: str = None) -> dict:
-    """加载 YAML 配置文件，并从系统环境变量中读取敏感凭证"""
+    """加载 YAML 配置文件，并从系统环境变量中读取敏感凭证
+
+    解析结果按路径缓存，每次返回独立副本，调用方可放心修改。
+    """
     if config_path is None:
         config_path = _BASE_DIR / "config" / "settings.yaml"
+    return copy.deepcopy(_load_config_cached(str(config_path)))
+
 
+@functools.lru_cache(maxsize=None)
+def _load_config_cached(config_path: str) -> dict:
     with open(config_path, "r", encoding="utf-8") as f:
         config = yaml.safe_load(f)
 
@@ -1,35 +1,152 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from pathlib import Path
 from typing import Dict, List, Optional
 import logging
+import pickle
+import threading
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils import atomic_write
 
 logger = logging.getLogger(__name__)
 
+# GitHub 返回的时间戳格式（UTC，秒级）；同格式的字符串可直接按字典序比较先后
+_GITHUB_TS_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+_DEFAULT_TRACK = ["releases", "issues", "pull_requests", "commits"]
+
+# GraphQL 批量查询中各跟踪类型对应的字段片段，与 REST 方法的默认条数保持一致
+_GQL_FRAGMENTS = {
+    "releases": """
+    releases(first: 5, orderBy: {field: CREATED_AT, direction: DESC}) {
+      nodes { tagName name url publishedAt description }
+    }""",
+    "issues": """
+    issues(first: 20, states: CLOSED, filterBy: {since: %(since)s},
+           orderBy: {field: UPDATED_AT, direction: DESC}) {
+      nodes { number title state url createdAt updatedAt author { login } }
+    }""",
+    "pull_requests": """
+    pullRequests(first: 20, states: MERGED, orderBy: {field: UPDATED_AT, direction: DESC}) {
+      nodes { number title url createdAt updatedAt author { login } }
+    }""",
+    "commits": """
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          history(first: 20, since: %(since)s) {
+            nodes { oid message url committedDate author { name } }
+          }
+        }
+      }
+    }""",
+}
+
 
 class GitHubClient:
     """封装 GitHub REST API 调用，获取仓库动态"""
 
     BASE_URL = "https://api.github.com"
+    GRAPHQL_URL = "https://api.github.com/graphql"
+    GRAPHQL_BATCH_SIZE = 10  # 单次 GraphQL 查询最多包含的仓库数，避免超出节点数限制
+    # (连接超时, 读取超时)：连接失败快速暴露；批量 GraphQL 查询服务端耗时更长，读取超时放宽
+    TIMEOUT = (5, 10)
+    GRAPHQL_TIMEOUT = (5, 30)
+    ETAG_CACHE_MAX_ENTRIES = 512  # ETag 缓存条目上限，超出时淘汰最久未使用的条目
 
-    def __init__(self, token: str):
+    def __init__(self, token: str, cache_dir: str = ""):
         self.session = requests.Session()
         self.session.headers.update({
             "Authorization": f"Bearer {token}",
             "Accept": "application/vnd.github+json",
             "X-GitHub-Api-Version": "2022-11-28",
         })
+        # 连接池容量匹配并发抓取规模；对限流与服务端错误做指数退避重试（GraphQL 查询只读，POST 同样可重试）
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset({"GET", "POST"}),
+            raise_on_status=False,  # 重试耗尽后返回最后一次响应，交由 raise_for_status 处理
+        )
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry)
+        self.session.mount("https://", adapter)
+        # 条件请求缓存（LRU）：(path, params) -> (ETag, 响应数据)；304 响应不计入速率限制
+        self._cache_file = Path(cache_dir) / ".etag_cache" if cache_dir else None
+        self._cache_lock = threading.Lock()
+        self._cache_dirty = False
+        self._etag_cache: "OrderedDict[tuple, tuple]" = self._load_etag_cache()
+
+    def _load_etag_cache(self) -> "OrderedDict[tuple, tuple]":
+        if self._cache_file is None or not self._cache_file.exists():
+            return OrderedDict()
+        try:
+            with open(self._cache_file, "rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logger.warning("读取 ETag 缓存失败，将重新建立: %s", e)
+            return OrderedDict()
+        cache = OrderedDict(data)
+        while len(cache) > self.ETAG_CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+        return cache
 
-    def _get(self, path: str, params: dict = None) -> list | dict:
+    def save_etag_cache(self):
+        """将 ETag 缓存持久化到磁盘（未配置缓存目录或无变更时跳过），应在一轮抓取全部结束后调用一次"""
+        if self._cache_file is None:
+            return
+        with self._cache_lock:
+            if not self._cache_dirty:
+                return
+            payload = pickle.dumps(self._etag_cache)
+            self._cache_dirty = False
+        # 原子写入（唯一临时文件），并发保存互不干扰，也不会留下残缺的缓存文件
+        try:
+            atomic_write(self._cache_file, payload)
+        except Exception as e:
+            logger.warning("保存 ETag 缓存失败: %s", e)
+            with self._cache_lock:
+                self._cache_dirty = True  # 保存失败，下次调用时重试
+
+    def _get(self, path: str, params: dict = None, use_etag: bool = True) -> list | dict:
+        """use_etag=False 时不发送也不记录条件请求（用于参数随时间变化、不可能命中的接口）"""
         url = f"{self.BASE_URL}{path}"
+        key = (path, frozenset((params or {}).items()))
+        cached = None
+        if use_etag:
+            with self._cache_lock:
+                cached = self._etag_cache.get(key)
+                if cached:
+                    self._etag_cache.move_to_end(key)
+        headers = {"If-None-Match": cached[0]} if cached else None
+
         logger.debug("GitHub API GET %s params=%s", path, params)
-        resp = self.session.get(url, params=params, timeout=30)
+        resp = self.session.get(url, params=params, headers=headers, timeout=self.TIMEOUT)
+        if resp.status_code == 304 and cached:
+            logger.debug("GitHub API 304 Not Modified %s，使用缓存数据", path)
+            return cached[1]
         resp.raise_for_status()
-        return resp.json()
+
+        data = orjson.loads(resp.content)
+        etag = resp.headers.get("ETag") if use_etag else None
+        if etag:
+            with self._cache_lock:
+                self._etag_cache[key] = (etag, data)
+                self._etag_cache.move_to_end(key)
+                while len(self._etag_cache) > self.ETAG_CACHE_MAX_ENTRIES:
+                    self._etag_cache.popitem(last=False)
+                self._cache_dirty = True
+        return data
 
     def _since_str(self, days: int) -> str:
-        """返回 ISO 8601 格式的时间字符串（UTC）"""
+        """返回与 GitHub 时间戳同格式的 ISO 8601 时间字符串（UTC）"""
         since = datetime.now(timezone.utc) - timedelta(days=days)
-        return since.isoformat()
+        return since.strftime(_GITHUB_TS_FORMAT)
 
     # ------------------------------------------------------------------ #
     # 各类动态获取方法
@@ -50,16 +167,19 @@ class GitHubClient:
             for r in data
         ]
 
-    def get_issues(self, owner: str, repo: str, days: int = 7, limit: int = 20) -> List[Dict]:
-        """获取近期已关闭的 Issues"""
+    def get_issues(
+        self, owner: str, repo: str, days: int = 7, limit: int = 20, since: Optional[str] = None
+    ) -> List[Dict]:
+        """获取近期已关闭的 Issues；since 为预先计算的起始时间，缺省时按 days 计算"""
         data = self._get(
             f"/repos/{owner}/{repo}/issues",
             params={
                 "state": "closed",
-                "since": self._since_str(days),
+                "since": since or self._since_str(days),
                 "per_page": limit,
                 "sort": "updated",
             },
+            use_etag=False,  # since 每次运行都不同，条件请求不会命中
         )
         return [
             {
@@ -76,8 +196,10 @@ class GitHubClient:
             if "pull_request" not in i  # 排除 PR（GitHub Issues API 会混合返回）
         ]
 
-    def get_pull_requests(self, owner: str, repo: str, days: int = 7, limit: int = 20) -> List[Dict]:
-        """获取近期已合并的 Pull Requests"""
+    def get_pull_requests(
+        self, owner: str, repo: str, days: int = 7, limit: int = 20, since: Optional[str] = None
+    ) -> List[Dict]:
+        """获取近期已合并的 Pull Requests；since 为预先计算的起始时间，缺省时按 days 计算"""
         data = self._get(
             f"/repos/{owner}/{repo}/pulls",
             params={
@@ -87,11 +209,11 @@ class GitHubClient:
                 "per_page": limit,
             },
         )
-        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        # 与 updated_at 同格式，直接比较字符串，无需逐条解析时间
+        cutoff = since or self._since_str(days)
         result = []
         for pr in data:
-            updated = datetime.fromisoformat(pr["updated_at"].replace("Z", "+00:00"))
-            if updated < cutoff:
+            if pr["updated_at"] < cutoff:  # 已按 updated 降序，遇到首个超出范围的即可停止
                 break
             if pr.get("merged_at") is None:  # 只保留已合并的，跳过直接关闭的
                 continue
@@ -108,14 +230,17 @@ class GitHubClient:
             })
         return result
 
-    def get_commits(self, owner: str, repo: str, days: int = 7, limit: int = 20) -> List[Dict]:
-        """获取近期 Commits"""
+    def get_commits(
+        self, owner: str, repo: str, days: int = 7, limit: int = 20, since: Optional[str] = None
+    ) -> List[Dict]:
+        """获取近期 Commits；since 为预先计算的起始时间，缺省时按 days 计算"""
         data = self._get(
             f"/repos/{owner}/{repo}/commits",
             params={
-                "since": self._since_str(days),
+                "since": since or self._since_str(days),
                 "per_page": limit,
             },
+            use_etag=False,  # since 每次运行都不同，条件请求不会命中
         )
         return [
             {
@@ -130,10 +255,10 @@ class GitHubClient:
         ]
 
     def fetch_updates(self, subscription: Dict, days: int = 7) -> Dict:
-        """根据订阅配置抓取所有跟踪类型的更新"""
+        """根据订阅配置抓取所有跟踪类型的更新；ETag 缓存不在此处落盘，调用方抓取完所有仓库后调用 save_etag_cache"""
         owner = subscription["owner"]
         repo = subscription["repo"]
-        track = subscription.get("track", ["releases", "issues", "pull_requests", "commits"])
+        track = subscription.get("track", _DEFAULT_TRACK)
 
         logger.info("开始抓取 %s/%s | 跟踪类型: %s | 时间范围: 近 %d 天", owner, repo, track, days)
 
@@ -145,17 +270,144 @@ class GitHubClient:
             "items": [],
         }
 
+        # 各接口共用同一起始时间，保证时间窗口一致
+        since = self._since_str(days)
+        fetchers = []
         if "releases" in track:
-            updates["items"].extend(self.get_releases(owner, repo))
+            fetchers.append(lambda: self.get_releases(owner, repo))
 
         if "issues" in track:
-            updates["items"].extend(self.get_issues(owner, repo, days=days))
+            fetchers.append(lambda: self.get_issues(owner, repo, since=since))
 
         if "pull_requests" in track:
-            updates["items"].extend(self.get_pull_requests(owner, repo, days=days))
+            fetchers.append(lambda: self.get_pull_requests(owner, repo, since=since))
 
         if "commits" in track:
-            updates["items"].extend(self.get_commits(owner, repo, days=days))
+            fetchers.append(lambda: self.get_commits(owner, repo, since=since))
+
+        # 各接口互不依赖，并发请求；按跟踪类型顺序合并结果，任一失败则抛出
+        if fetchers:
+            with ThreadPoolExecutor(max_workers=len(fetchers)) as executor:
+                futures = [executor.submit(fetch) for fetch in fetchers]
+                for future in futures:
+                    updates["items"].extend(future.result())
 
         logger.info("抓取完成 %s/%s | 共 %d 条更新", owner, repo, len(updates["items"]))
         return updates
+
+    # ------------------------------------------------------------------ #
+    # GraphQL 批量抓取
+    # ------------------------------------------------------------------ #
+
+    def _graphql(self, query: str) -> Dict:
+        logger.debug("GitHub GraphQL POST\n%s", query)
+        resp = self.session.post(self.GRAPHQL_URL, json={"query": query}, timeout=self.GRAPHQL_TIMEOUT)
+        resp.raise_for_status()
+        payload = orjson.loads(resp.content)
+        for err in payload.get("errors") or []:
+            logger.warning("GitHub GraphQL 错误: %s", err.get("message"))
+        if payload.get("data") is None:
+            raise RuntimeError(f"GraphQL 查询失败：{payload.get('errors')}")
+        return payload["data"]
+
+    @staticmethod
+    def _parse_graphql_repo(node: Dict, track: List[str], cutoff: str) -> List[Dict]:
+        """将 GraphQL 仓库节点转换为与 REST 方法一致的更新条目"""
+        items = []
+        if "releases" in track:
+            items.extend(
+                {
+                    "type": "release",
+                    "tag": r["tagName"],
+                    "name": r["name"],
+                    "url": r["url"],
+                    "published_at": r["publishedAt"],
+                    "body": (r.get("description") or "")[:500],
+                }
+                for r in node["releases"]["nodes"]
+            )
+        if "issues" in track:
+            items.extend(
+                {
+                    "type": "issue",
+                    "number": i["number"],
+                    "title": i["title"],
+                    "state": i["state"].lower(),
+                    "url": i["url"],
+                    "created_at": i["createdAt"],
+                    "updated_at": i["updatedAt"],
+                    "user": (i["author"] or {}).get("login", ""),
+                }
+                for i in node["issues"]["nodes"]
+            )
+        if "pull_requests" in track:
+            for pr in node["pullRequests"]["nodes"]:
+                if pr["updatedAt"] < cutoff:  # 已按 updated 降序
+                    break
+                items.append({
+                    "type": "pull_request",
+                    "number": pr["number"],
+                    "title": pr["title"],
+                    "state": "closed",
+                    "url": pr["url"],
+                    "created_at": pr["createdAt"],
+                    "updated_at": pr["updatedAt"],
+                    "user": (pr["author"] or {}).get("login", ""),
+                    "merged": True,
+                })
+        if "commits" in track:
+            target = (node.get("defaultBranchRef") or {}).get("target") or {}
+            items.extend(
+                {
+                    "type": "commit",
+                    "sha": c["oid"][:7],
+                    "message": c["message"].split("\n")[0],  # 只取首行
+                    "url": c["url"],
+                    "date": c["committedDate"],
+                    "author": (c["author"] or {}).get("name", ""),
+                }
+                for c in target.get("history", {}).get("nodes", [])
+            )
+        return items
+
+    def fetch_updates_batch(self, subscriptions: List[Dict], days: int = 7) -> List[Optional[Dict]]:
+        """通过 GraphQL 一次性抓取多个仓库的更新
+
+        返回值与 subscriptions 一一对应；无法解析的仓库（不存在或无权限）对应 None。
+        整个请求失败时抛出异常。
+        """
+        cutoff = self._since_str(days)
+        since = orjson.dumps(cutoff).decode()
+        fetched_at = datetime.now(timezone.utc).isoformat()
+        results: List[Optional[Dict]] = []
+
+        for start in range(0, len(subscriptions), self.GRAPHQL_BATCH_SIZE):
+            batch = subscriptions[start:start + self.GRAPHQL_BATCH_SIZE]
+            blocks = []
+            for idx, sub in enumerate(batch):
+                track = sub.get("track", _DEFAULT_TRACK)
+                fields = "".join(_GQL_FRAGMENTS[t] for t in _GQL_FRAGMENTS if t in track)
+                blocks.append(
+                    f"  repo{idx}: repository(owner: {orjson.dumps(sub['owner']).decode()}, "
+                    f"name: {orjson.dumps(sub['repo']).decode()}) {{ id{fields % {'since': since}} }}"
+                )
+            logger.info("开始 GraphQL 批量抓取 %d 个仓库 | 时间范围: 近 %d 天", len(batch), days)
+            data = self._graphql("query {\n" + "\n".join(blocks) + "\n}")
+
+            for idx, sub in enumerate(batch):
+                owner, repo = sub["owner"], sub["repo"]
+                node = data.get(f"repo{idx}")
+                if node is None:
+                    logger.warning("GraphQL 未返回 %s/%s（仓库不存在或无访问权限）", owner, repo)
+                    results.append(None)
+                    continue
+                items = self._parse_graphql_repo(node, sub.get("track", _DEFAULT_TRACK), cutoff)
+                logger.info("抓取完成 %s/%s | 共 %d 条更新", owner, repo, len(items))
+                results.append({
+                    "owner": owner,
+                    "repo": repo,
+                    "label": sub.get("label", f"{owner}/{repo}"),
+                    "fetched_at": fetched_at,
+                    "items": items,
+                })
+        return results
@@ -1,4 +1,5 @@
 """llm 包"""
+from .cache import ResponseCache
 from .reporter import LLMReporter, list_ollama_models
 
-__all__ = ["LLMReporter", "list_ollama_models"]
+__all__ = ["LLMReporter", "ResponseCache", "list_ollama_models"]
@@ -0,0 +1,71 @@
+import hashlib
+import logging
+import time
+from pathlib import Path
+from typing import Optional
+
+import orjson
+
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """LLM 响应的磁盘缓存：相同模型与提示词在有效期内直接复用上次生成的报告"""
+
+    def __init__(self, cache_dir: str, ttl: int = 24 * 3600):
+        """
+        cache_dir: 缓存目录，每条记录保存为 <hash>.json
+        ttl: 有效期（秒），<= 0 表示不使用缓存
+        """
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_prompt: str) -> str:
+        h = hashlib.sha256()
+        for part in (model, system_prompt, user_prompt):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")  # 分隔各部分，避免拼接歧义
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        """返回未过期的缓存内容，不存在或已过期时返回 None；过期或损坏的记录会被删除"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            entry = orjson.loads(path.read_bytes())
+            # 取记录时与当前配置中较小的有效期，调低 cache_ttl_hours 后对已有记录立即生效
+            expired = time.time() - entry["created_at"] > min(entry.get("ttl", self.ttl), self.ttl)
+            content = entry["content"]
+            if not isinstance(content, str):
+                raise TypeError(f"content 类型无效: {type(content).__name__}")
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("读取 LLM 缓存失败，已删除该记录 %s: %s", key, e)
+            path.unlink(missing_ok=True)
+            return None
+        if expired:
+            path.unlink(missing_ok=True)
+            return None
+        return content
+
+    def set(self, key: str, content: str, model: str = ""):
+        """写入缓存；先写临时文件再原子替换，并发写同一键也不会读到残缺内容"""
+        if not self.enabled:
+            return
+        entry = {"content": content, "model": model, "created_at": time.time(), "ttl": self.ttl}
+        try:
+            atomic_write(self._path(key), orjson.dumps(entry))
+        except Exception as e:
+            logger.warning("写入 LLM 缓存失败 %s: %s", key, e)
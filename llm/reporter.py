@@ -1,7 +1,16 @@
-import json
+import hashlib
 import logging
-from typing import Dict, List
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import orjson
+import requests
 from openai import OpenAI
+from requests.adapters import HTTPAdapter
+
+from .cache import ResponseCache
 
 logger = logging.getLogger(__name__)
 
@@ -16,74 +25,144 @@ SYSTEM_PROMPT = """你是一位专业的 GitHub 项目分析师。
 5. 在报告末尾给出一句话的整体评价
 """
 
+# 用户消息的固定开头：与 SYSTEM_PROMPT 一起构成各仓库请求共享的前缀，
+# 便于 DeepSeek 的上下文硬盘缓存（按前缀自动命中）复用，变化的仓库数据放在其后
+_USER_PROMPT_HEADER = "请根据以下数据生成一份 Markdown 格式的中文摘要报告。"
+
+# 多仓库合并请求：每个仓库的数据与输出均以分隔标记开头，便于按仓库拆分响应
+_BATCH_PROMPT_HEADER = (
+    "以下包含 {count} 个仓库的数据，请为每个仓库分别生成一份 Markdown 格式的中文摘要报告。\n"
+    "每份报告必须以该仓库的分隔标记单独成行开头（原样输出，如 ===REPO:owner/repo===），"
+    "按给出的顺序依次输出，分隔标记之外不要输出其他内容。"
+)
+_RE_REPO_DELIMITER = re.compile(r"^===REPO:(\S+?)===[ \t]*$", re.MULTILINE)
+
 _DEEPSEEK_BASE_URL = "https://api.deepseek.com"
 _OLLAMA_DEFAULT_BASE_URL = "http://localhost:11434"
+_OLLAMA_MODELS_TTL = 30  # 模型列表缓存有效期（秒）
+
+# 复用连接，避免界面中反复刷新模型列表时每次重新建立 TCP 连接
+_ollama_session = requests.Session()
+_ollama_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+_ollama_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+
+@lru_cache(maxsize=8)
+def _fetch_ollama_models(base_url: str, bucket: int) -> Tuple[str, ...]:
+    """bucket 为当前时间所在的 TTL 时间片，时间片变化后缓存自然失效；失败时抛出异常，不会被缓存"""
+    resp = _ollama_session.get(f"{base_url}/api/tags", timeout=5)
+    resp.raise_for_status()
+    models = orjson.loads(resp.content).get("models", [])
+    return tuple(m["name"] for m in models)
 
 
 def list_ollama_models(base_url: str = _OLLAMA_DEFAULT_BASE_URL) -> List[str]:
-    """查询 Ollama 本地可用模型列表，返回模型名称列表。失败时返回空列表。"""
-    import requests
+    """查询 Ollama 本地可用模型列表，返回模型名称列表（缓存 30 秒）。失败时返回空列表。"""
     try:
-        resp = requests.get(f"{base_url.rstrip('/')}/api/tags", timeout=5)
-        resp.raise_for_status()
-        models = resp.json().get("models", [])
-        return [m["name"] for m in models]
+        bucket = int(time.time() // _OLLAMA_MODELS_TTL)
+        return list(_fetch_ollama_models(base_url.rstrip("/"), bucket))
     except Exception as e:
         logger.warning("获取 Ollama 模型列表失败: %s", e)
         return []
 
 
-def _build_user_prompt(updates: Dict) -> str:
-    owner = updates["owner"]
-    repo = updates["repo"]
-    label = updates["label"]
-    fetched_at = updates["fetched_at"]
-    items = updates.get("items", [])
-
-    # 按类型分组
-    groups: Dict[str, List] = {
-        "release": [],
-        "issue": [],
-        "pull_request": [],
-        "commit": [],
-    }
+def _build_data_sections(items: List[Dict]) -> str:
+    """按类型分组并序列化更新条目，是构建提示词中开销最大的部分，调用方可复用其结果"""
+    # 按类型分组，直接追加到局部列表，省去事后对各分组的再次扫描
+    rel, iss, prs, com = [], [], [], []
+    buckets = {"release": rel, "issue": iss, "pull_request": prs, "commit": com}
     for item in items:
-        t = item.get("type", "")
-        if t in groups:
-            groups[t].append(item)
-
-    prompt_parts = [
-        f"仓库：{label} ({owner}/{repo})",
-        f"数据获取时间：{fetched_at}",
-        "",
+        bucket = buckets.get(item.get("type", ""))
+        if bucket is not None:
+            bucket.append(item)
+
+    # 每个分组的标题与数据合并为一段，最后只做一次 join
+    section_parts = [
+        f"## {title} 数据\n\n{orjson.dumps(group).decode()}"
+        for title, group in (
+            ("Releases", rel),
+            ("Issues", iss),
+            ("Pull Requests", prs),
+            ("Commits", com),
+        )
+        if group
     ]
+    if not section_parts:
+        return "（本周期内无任何更新）"
+    return "\n\n".join(section_parts)
 
-    if groups["release"]:
-        prompt_parts.append("## Releases 数据")
-        prompt_parts.append(json.dumps(groups["release"], ensure_ascii=False, indent=2))
 
-    if groups["issue"]:
-        prompt_parts.append("## Issues 数据")
-        prompt_parts.append(json.dumps(groups["issue"], ensure_ascii=False, indent=2))
+def _build_user_prompt(updates: Dict, data_sections: Optional[str] = None) -> str:
+    """data_sections 为 _build_data_sections 的结果，缺省时按 updates["items"] 现场生成"""
+    if data_sections is None:
+        data_sections = _build_data_sections(updates.get("items", []))
+    # 单个 f-string 一次性拼出完整提示词（数据段前保留一个空段落，与既有提示词格式一致）
+    return (
+        f"{_USER_PROMPT_HEADER}\n\n"
+        f"仓库：{updates['label']} ({updates['owner']}/{updates['repo']})\n\n"
+        f"数据获取时间：{updates['fetched_at']}\n\n\n\n"
+        f"{data_sections}"
+    )
 
-    if groups["pull_request"]:
-        prompt_parts.append("## Pull Requests 数据")
-        prompt_parts.append(json.dumps(groups["pull_request"], ensure_ascii=False, indent=2))
 
-    if groups["commit"]:
-        prompt_parts.append("## Commits 数据")
-        prompt_parts.append(json.dumps(groups["commit"], ensure_ascii=False, indent=2))
+def _log_prompt_digest(label: str, user_prompt: str):
+    """调试日志只记录提示词长度与摘要哈希，不写出整段（可能很大的）提示词"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "LLM user prompt | 仓库: %s | len=%d | sha=%s",
+            label,
+            len(user_prompt),
+            hashlib.sha256(user_prompt.encode("utf-8")).hexdigest()[:12],
+        )
+
+
+def _repo_delimiter(updates: Dict) -> str:
+    return f"===REPO:{updates['owner']}/{updates['repo']}==="
 
-    if not any(groups.values()):
-        prompt_parts.append("（本周期内无任何更新）")
 
-    prompt_parts.append("\n请根据以上数据生成一份 Markdown 格式的中文摘要报告。")
+def _build_batch_prompt(batch: List[Dict], data_sections: Optional[List[str]] = None) -> str:
+    """将多个仓库的数据合并为一条提示词，各仓库段落以 _repo_delimiter 分隔
+
+    data_sections 为与 batch 一一对应的 _build_data_sections 结果，缺省时现场生成。
+    """
+    if data_sections is None:
+        data_sections = [_build_data_sections(updates.get("items", [])) for updates in batch]
+    prompt_parts = [_BATCH_PROMPT_HEADER.format(count=len(batch))]
+    for updates, sections in zip(batch, data_sections):
+        prompt_parts.append(_repo_delimiter(updates))
+        prompt_parts.append(f"仓库：{updates['label']} ({updates['owner']}/{updates['repo']})")
+        prompt_parts.append(f"数据获取时间：{updates['fetched_at']}")
+        prompt_parts.append(sections)
     return "\n\n".join(prompt_parts)
 
 
+def _split_batch_response(content: str) -> Dict[str, str]:
+    """按分隔标记拆分合并响应，返回 {"owner/repo": 报告内容}"""
+    pieces = _RE_REPO_DELIMITER.split(content)
+    # pieces: [标记前的内容, 仓库1, 报告1, 仓库2, 报告2, ...]
+    return {
+        pieces[i].strip(): pieces[i + 1].strip()
+        for i in range(1, len(pieces) - 1, 2)
+        if pieces[i + 1].strip()
+    }
+
+
+def _format_digest(all_updates: List[Dict], reports: List[Union[str, Exception]]) -> str:
+    parts = []
+    for updates, report in zip(all_updates, reports):
+        label = updates.get("label", f"{updates['owner']}/{updates['repo']}")
+        if isinstance(report, Exception):
+            report = f"（报告生成失败：{report}）"
+        parts.append(f"# {label}\n\n{report}")
+
+    return "\n\n---\n\n".join(parts)
+
+
 class LLMReporter:
     """生成仓库更新摘要报告，支持 DeepSeek 和本地 Ollama 模型"""
 
+    MAX_CONCURRENCY = 8  # 并发生成报告时的最大同时请求数
+
     def __init__(
         self,
         model: str = "deepseek-chat",
@@ -91,10 +170,15 @@ class LLMReporter:
         provider: str = "deepseek",
         api_key: str = "",
         base_url: str = "",
+        cache: Optional[ResponseCache] = None,
+        skip_empty: bool = True,
     ):
+        """skip_empty: 无任何更新的仓库不调用 LLM，直接返回固定文案"""
         self.model = model
         self.max_tokens = max_tokens
         self.provider = provider
+        self.cache = cache
+        self.skip_empty = skip_empty
 
         if provider == "ollama":
             actual_base_url = (base_url or _OLLAMA_DEFAULT_BASE_URL).rstrip("/")
@@ -108,21 +192,151 @@ class LLMReporter:
                 base_url=_DEEPSEEK_BASE_URL,
             )
 
+    def _build_messages(self, updates: Dict, label: str, data_sections: str) -> List[Dict]:
+        user_prompt = _build_user_prompt(updates, data_sections)
+
+        logger.info("开始调用 LLM | 仓库: %s | 模型: %s", label, self.model)
+        _log_prompt_digest(label, user_prompt)
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    @staticmethod
+    def _log_usage(label: str, usage):
+        if usage:
+            logger.info(
+                "LLM 调用完成 | 仓库: %s | prompt_tokens: %s | completion_tokens: %s | total_tokens: %s"
+                " | cache_hit_tokens: %s",
+                label,
+                usage.prompt_tokens,
+                usage.completion_tokens,
+                usage.total_tokens,
+                getattr(usage, "prompt_cache_hit_tokens", "n/a"),  # DeepSeek 扩展字段
+            )
+        else:
+            logger.info("LLM 调用完成 | 仓库: %s", label)
+
+    def _cache_key(self, updates: Dict, data_sections: str) -> Optional[str]:
+        """无更新的仓库不缓存，避免过期的“无更新”报告被长期复用"""
+        if self.cache is None or not self.cache.enabled or not updates.get("items"):
+            return None
+        # 数据获取时间每次运行都不同，不参与缓存键
+        user_prompt = _build_user_prompt({**updates, "fetched_at": ""}, data_sections)
+        return ResponseCache.make_key(self.model, SYSTEM_PROMPT, user_prompt)
+
+    def _skip_report(self, updates: Dict, label: str) -> Optional[str]:
+        """开启 skip_empty 且仓库无更新时返回固定文案，否则返回 None"""
+        if self.skip_empty and not updates.get("items"):
+            logger.info("跳过 LLM 调用（无更新）| 仓库: %s", label)
+            return f"（{label} 本周期内无任何更新）"
+        return None
+
     def generate_report(self, updates: Dict) -> str:
         """为单个仓库的更新生成 AI 摘要"""
         label = updates.get("label", f"{updates['owner']}/{updates['repo']}")
-        user_prompt = _build_user_prompt(updates)
+        skipped = self._skip_report(updates, label)
+        if skipped is not None:
+            return skipped
+        data_sections = _build_data_sections(updates.get("items", []))  # 缓存键与请求共用一次序列化
+        cache_key = self._cache_key(updates, data_sections)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("LLM 缓存命中 | 仓库: %s | 模型: %s", label, self.model)
+                return cached
 
-        logger.info("开始调用 LLM | 仓库: %s | 模型: %s", label, self.model)
-        logger.debug(
-            "LLM system prompt:\n%s",
-            SYSTEM_PROMPT,
+        response = self.client.chat.completions.create(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            messages=self._build_messages(updates, label, data_sections),
         )
-        logger.debug(
-            "LLM user prompt | 仓库: %s\n%s",
-            label,
-            user_prompt,
+        self._log_usage(label, response.usage)
+        content = response.choices[0].message.content
+        if cache_key:
+            self.cache.set(cache_key, content, model=self.model)
+        return content
+
+    def stream_report(self, updates: Dict) -> Iterator[str]:
+        """以流式方式生成单个仓库的 AI 摘要，逐段产出文本增量"""
+        label = updates.get("label", f"{updates['owner']}/{updates['repo']}")
+        skipped = self._skip_report(updates, label)
+        if skipped is not None:
+            yield skipped
+            return
+        data_sections = _build_data_sections(updates.get("items", []))  # 缓存键与请求共用一次序列化
+        cache_key = self._cache_key(updates, data_sections)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("LLM 缓存命中 | 仓库: %s | 模型: %s", label, self.model)
+                yield cached
+                return
+
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            messages=self._build_messages(updates, label, data_sections),
+            stream=True,
+            stream_options={"include_usage": True},
         )
+        usage = None
+        parts = []
+        for chunk in stream:
+            if chunk.usage:  # 开启 include_usage 后，最后一个分片只携带用量信息
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                delta = chunk.choices[0].delta.content
+                parts.append(delta)
+                yield delta
+        self._log_usage(label, usage)
+        if cache_key:  # 仅在完整接收后写入缓存
+            self.cache.set(cache_key, "".join(parts), model=self.model)
+
+    def generate_reports(self, all_updates: List[Dict]) -> List[Union[str, Exception]]:
+        """并发为多个仓库生成摘要，结果与输入顺序一致；单个仓库失败时对应位置为异常对象"""
+        if not all_updates:
+            return []
+
+        def _safe_generate(updates: Dict) -> Union[str, Exception]:
+            try:
+                return self.generate_report(updates)
+            except Exception as e:
+                label = updates.get("label", f"{updates['owner']}/{updates['repo']}")
+                logger.error("LLM 调用失败 | 仓库: %s | %s", label, e)
+                return e
+
+        # 各仓库报告互不依赖，并发调用 LLM；map 保持原有顺序
+        with ThreadPoolExecutor(max_workers=min(self.MAX_CONCURRENCY, len(all_updates))) as executor:
+            return list(executor.map(_safe_generate, all_updates))
+
+    def generate_digest(self, all_updates: List[Dict]) -> str:
+        """为多个仓库生成汇总 Digest 报告"""
+        return _format_digest(all_updates, self.generate_reports(all_updates))
+
+    def _batch_cache_key(self, batch: List[Dict], data_sections: List[str]) -> Optional[str]:
+        """合并请求的缓存键由整条批量提示词决定，与单仓库 generate_report 的缓存互不混用"""
+        if self.cache is None or not self.cache.enabled or not all(u.get("items") for u in batch):
+            return None
+        # 数据获取时间每次运行都不同，不参与缓存键
+        user_prompt = _build_batch_prompt([{**u, "fetched_at": ""} for u in batch], data_sections)
+        return ResponseCache.make_key(self.model, SYSTEM_PROMPT, user_prompt)
+
+    def _generate_batch(self, batch: List[Dict], data_sections: Optional[List[str]] = None) -> Dict[str, str]:
+        """单次请求为一批仓库生成报告，返回 {"owner/repo": 报告}；未能解析出的仓库不在结果中"""
+        labels = ", ".join(u.get("label", f"{u['owner']}/{u['repo']}") for u in batch)
+        if data_sections is None:
+            data_sections = [_build_data_sections(u.get("items", [])) for u in batch]
+        cache_key = self._batch_cache_key(batch, data_sections)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("LLM 缓存命中（批量 %d 个仓库）| 仓库: %s | 模型: %s", len(batch), labels, self.model)
+                return _split_batch_response(cached)
+
+        user_prompt = _build_batch_prompt(batch, data_sections)
+        logger.info("开始调用 LLM（批量 %d 个仓库）| 仓库: %s | 模型: %s", len(batch), labels, self.model)
+        _log_prompt_digest(labels, user_prompt)
 
         response = self.client.chat.completions.create(
             model=self.model,
@@ -132,27 +346,58 @@ class LLMReporter:
                 {"role": "user", "content": user_prompt},
             ],
         )
+        self._log_usage(labels, response.usage)
+        choice = response.choices[0]
+        content = choice.message.content or ""
+        sections = _split_batch_response(content)
+        if choice.finish_reason == "length":
+            # 输出被截断时最后一段不完整，丢弃后交由单仓库请求补齐；不完整的响应不缓存
+            if sections:
+                sections.pop(list(sections)[-1])
+        elif cache_key and sections:
+            self.cache.set(cache_key, content, model=self.model)
+        return sections
 
-        usage = response.usage
-        if usage:
-            logger.info(
-                "LLM 调用完成 | 仓库: %s | prompt_tokens: %s | completion_tokens: %s | total_tokens: %s",
-                label,
-                usage.prompt_tokens,
-                usage.completion_tokens,
-                usage.total_tokens,
-            )
-        else:
-            logger.info("LLM 调用完成 | 仓库: %s", label)
+    def generate_batched_reports(
+        self, all_updates: List[Dict], batch_size: int = 5
+    ) -> List[Union[str, Exception]]:
+        """每 batch_size 个仓库合并为一次 LLM 请求，结果与输入顺序一致
 
-        return response.choices[0].message.content
+        批量响应中缺失或被截断的仓库会退回 generate_reports 单独生成。
+        合并请求的完整响应按批量提示词缓存，数据不变时再次运行直接复用。
+        """
+        if not all_updates:
+            return []
+        reports: List[Union[str, Exception, None]] = [
+            self._skip_report(u, u.get("label", f"{u['owner']}/{u['repo']}")) for u in all_updates
+        ]
+        # 无更新而被跳过的仓库不参与合并请求
+        pending = [u for u, report in zip(all_updates, reports) if report is None]
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
 
-    def generate_digest(self, all_updates: List[Dict]) -> str:
-        """为多个仓库生成汇总 Digest 报告"""
-        parts = []
-        for updates in all_updates:
-            label = updates.get("label", f"{updates['owner']}/{updates['repo']}")
-            report = self.generate_report(updates)
-            parts.append(f"# {label}\n\n{report}")
+        def _safe_batch(batch: List[Dict]) -> Dict[str, str]:
+            try:
+                return self._generate_batch(batch)
+            except Exception as e:
+                logger.error("LLM 批量调用失败，将逐个重试 | %s", e)
+                return {}
+
+        sections: Dict[str, str] = {}
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(self.MAX_CONCURRENCY, len(batches))) as executor:
+                for result in executor.map(_safe_batch, batches):
+                    sections.update(result)
+
+        for i, u in enumerate(all_updates):
+            if reports[i] is None:
+                reports[i] = sections.get(f"{u['owner']}/{u['repo']}")
+        missing = [i for i, report in enumerate(reports) if report is None]
+        if missing:
+            logger.info("批量响应缺少 %d 个仓库的报告，改为单独生成", len(missing))
+            for i, report in zip(missing, self.generate_reports([all_updates[i] for i in missing])):
+                reports[i] = report
+        return reports
 
-        return "\n\n---\n\n".join(parts)
+    def generate_batched_digest(self, all_updates: List[Dict], batch_size: int = 5) -> str:
+        """以合并请求的方式生成多仓库汇总 Digest 报告"""
+        return _format_digest(all_updates, self.generate_batched_reports(all_updates, batch_size))
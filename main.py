@@ -3,16 +3,18 @@
 GitHub Sentinel - 交互式 REPL 入口
 """
 
+import atexit
+import functools
 import logging
 import logging.handlers
-import re
-import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 from config import load_config
-from subscription import SubscriptionManager
+from subscription import SubscriptionManager, parse_repo_arg
 from github_client import GitHubClient
-from llm import LLMReporter
+from llm import LLMReporter, ResponseCache
 from notifier import FileNotifier
 from scheduler import SentinelScheduler
 
@@ -36,7 +38,15 @@ _console_handler = logging.StreamHandler()
 _console_handler.setLevel(logging.WARNING)
 _console_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
 
-logging.basicConfig(level=logging.DEBUG, handlers=[_file_handler, _console_handler])
+# 日志调用方只做内存入队，文件滚动与写入由后台监听线程完成
+_log_queue = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, _file_handler, _console_handler, respect_handler_level=True
+)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logging.basicConfig(level=logging.DEBUG, handlers=[logging.handlers.QueueHandler(_log_queue)])
 logger = logging.getLogger("sentinel")
 
 HELP_TEXT = """
@@ -44,27 +54,52 @@ HELP_TEXT = """
   run                  立即抓取所有订阅仓库并生成 AI 摘要报告
   schedule             在后台启动定时调度（按 settings.yaml 中的时间执行）
   list                 查看当前订阅列表
-  add <owner/repo>     添加仓库订阅，例如：add microsoft/vscode
+  add <owner/repo>...  添加仓库订阅（可空格分隔多个），例如：add microsoft/vscode
   remove <owner/repo>  移除仓库订阅，例如：remove microsoft/vscode
   help                 显示帮助信息
   exit / quit          退出程序
 """
 
 
-def build_components(config: dict):
-    sub_manager = SubscriptionManager(config["subscriptions_file"])
-    gh_client = GitHubClient(config["github"]["token"])
-    reporter = LLMReporter(
-        api_key=config["llm"]["api_key"],
-        model=config["llm"]["model"],
-        max_tokens=config["llm"]["max_tokens"],
+@functools.lru_cache(maxsize=4)
+def _get_github_client(token: str, cache_dir: str) -> GitHubClient:
+    # 进程内按配置复用，多次 run 之间保留 requests.Session 的连接池与 ETag 缓存
+    return GitHubClient(token, cache_dir=cache_dir)
+
+
+@functools.lru_cache(maxsize=4)
+def _get_reporter(
+    api_key: str, model: str, max_tokens: int, output_dir: str, cache_ttl: int, skip_empty: bool
+) -> LLMReporter:
+    # 进程内按配置复用 OpenAI 客户端及其连接池，避免每次 run 重新建立 TLS 连接
+    return LLMReporter(
+        api_key=api_key,
+        model=model,
+        max_tokens=max_tokens,
+        cache=ResponseCache(str(Path(output_dir) / ".llm_cache"), ttl=cache_ttl),
+        skip_empty=skip_empty,
+    )
+
+
+def build_components(config: dict, sub_manager: SubscriptionManager = None):
+    if sub_manager is None:
+        sub_manager = SubscriptionManager(config["subscriptions_file"])
+    output_dir = config["report"]["output_dir"]
+    gh_client = _get_github_client(config["github"]["token"], output_dir)
+    reporter = _get_reporter(
+        config["llm"]["api_key"],
+        config["llm"]["model"],
+        config["llm"]["max_tokens"],
+        output_dir,
+        int(config["llm"].get("cache_ttl_hours", 24) * 3600),
+        bool(config["llm"].get("skip_empty", True)),
     )
     notifier = FileNotifier(config["report"]["output_dir"])
     return sub_manager, gh_client, reporter, notifier
 
 
-def run_once(config: dict):
-    sub_manager, gh_client, reporter, notifier = build_components(config)
+def run_once(config: dict, sub_manager: SubscriptionManager = None):
+    sub_manager, gh_client, reporter, notifier = build_components(config, sub_manager=sub_manager)
     subscriptions = sub_manager.list_subscriptions()
 
     if not subscriptions:
@@ -74,53 +109,76 @@ def run_once(config: dict):
     days = 7 if config["scheduler"]["interval"] == "weekly" else 1
     print(f"[开始] 抓取 {len(subscriptions)} 个仓库的近 {days} 天更新...")
 
-    all_updates = []
-    for sub in subscriptions:
-        label = sub.get("label", f"{sub['owner']}/{sub['repo']}")
-        print(f"  → 正在获取 {label} ...")
-        try:
-            updates = gh_client.fetch_updates(sub, days=days)
-            all_updates.append(updates)
-            print(f"     获取到 {len(updates['items'])} 条更新")
-        except Exception as e:
-            print(f"[错误] 获取 {label} 失败：{e}")
+    # 各仓库抓取互不依赖，并发执行；单个仓库失败不影响其他仓库
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(16, len(subscriptions))) as executor:
+        futures = {}
+        for idx, sub in enumerate(subscriptions):
+            label = sub.get("label", f"{sub['owner']}/{sub['repo']}")
+            print(f"  → 正在获取 {label} ...")
+            futures[executor.submit(gh_client.fetch_updates, sub, days=days)] = (idx, label)
+        for future in as_completed(futures):
+            idx, label = futures[future]
+            try:
+                updates = future.result()
+                results[idx] = updates
+                print(f"     {label}：获取到 {len(updates['items'])} 条更新")
+            except Exception as e:
+                print(f"[错误] 获取 {label} 失败：{e}")
+
+    gh_client.save_etag_cache()  # 整轮抓取结束后落盘一次
+
+    # 保持与订阅列表一致的报告顺序
+    all_updates = [results[idx] for idx in sorted(results)]
 
     if not all_updates:
         print("[警告] 所有仓库获取失败，请检查 GitHub Token 和网络连接")
         return
 
-    print("\n[AI] 正在生成摘要报告...")
-    for updates in all_updates:
+    def _stream_to_file(updates: dict) -> str:
         label = updates.get("label", f"{updates['owner']}/{updates['repo']}")
         repo_slug = f"{updates['owner']}_{updates['repo']}"
-        print(f"  → 正在为 {label} 生成摘要报告...")
-        report = reporter.generate_report(updates)
-        notifier.send(report, title=f"{label} 报告", repo_slug=repo_slug)
-    print("[完成] 所有报告生成成功！")
-
-
-def start_schedule(config: dict):
+        # 流式输出边生成边写入报告文件
+        return notifier.send(reporter.stream_report(updates), title=f"{label} 报告", repo_slug=repo_slug)
+
+    failed = 0
+    batch_size = config["llm"].get("batch_size", 1)
+    if batch_size > 1:
+        # 多个仓库合并为一次请求，减少请求次数；合并响应按仓库拆分后分别保存
+        print(f"\n[AI] 正在合并生成 {len(all_updates)} 份摘要报告（每批 {batch_size} 个仓库）...")
+        reports = reporter.generate_batched_reports(all_updates, batch_size=batch_size)
+        for updates, report in zip(all_updates, reports):
+            label = updates.get("label", f"{updates['owner']}/{updates['repo']}")
+            if isinstance(report, Exception):
+                failed += 1
+                print(f"[错误] 生成 {label} 报告失败：{report}")
+                continue
+            repo_slug = f"{updates['owner']}_{updates['repo']}"
+            notifier.send(report, title=f"{label} 报告", repo_slug=repo_slug)
+    else:
+        print(f"\n[AI] 正在并发生成 {len(all_updates)} 份摘要报告...")
+        with ThreadPoolExecutor(max_workers=min(reporter.MAX_CONCURRENCY, len(all_updates))) as executor:
+            futures = {executor.submit(_stream_to_file, updates): updates for updates in all_updates}
+            for future in as_completed(futures):
+                updates = futures[future]
+                label = updates.get("label", f"{updates['owner']}/{updates['repo']}")
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"[错误] 生成 {label} 报告失败：{e}")
+    if failed:
+        print(f"[完成] {len(all_updates) - failed} 份报告生成成功，{failed} 份失败")
+    else:
+        print("[完成] 所有报告生成成功！")
+
+
+def start_schedule(config: dict, sub_manager: SubscriptionManager = None):
     interval = config["scheduler"]["interval"]
     time_str = config["scheduler"]["time"]
     scheduler = SentinelScheduler(interval=interval, time_str=time_str)
-    # 在后台线程中运行，不阻塞 REPL
-    t = threading.Thread(target=scheduler.start, args=(lambda: run_once(config),), daemon=True)
-    t.start()
-
-
-def parse_repo_arg(arg: str):
-    """解析 owner/repo 或完整 GitHub URL，返回 (owner, repo) 或 None"""
-    arg = arg.strip()
-    # 匹配完整 URL：https://github.com/owner/repo 或 github.com/owner/repo
-    match = re.search(r"github\.com/([^/]+)/([^/\s]+)", arg)
-    if match:
-        return match.group(1), match.group(2).rstrip("/")
-    # 匹配 owner/repo 格式
-    parts = arg.strip("/").split("/")
-    if len(parts) == 2 and all(parts):
-        return parts[0], parts[1]
-    return None
-
+    # 调度器在自己的后台线程中运行，不阻塞 REPL
+    scheduler.start(lambda: run_once(config, sub_manager=sub_manager))
 
 
 def repl(config: dict):
@@ -129,6 +187,9 @@ def repl(config: dict):
     print("  输入 help 查看可用命令")
     print("=" * 50)
 
+    # 整个会话共用一个订阅管理器，避免每条命令都重新读取订阅文件
+    sub_manager = SubscriptionManager(config["subscriptions_file"])
+
     while True:
         try:
             raw = input("\n>>> ").strip()
@@ -151,19 +212,17 @@ def repl(config: dict):
             print(HELP_TEXT)
 
         elif cmd == "list":
-            sub_manager = SubscriptionManager(config["subscriptions_file"])
             sub_manager.display()
 
         elif cmd == "add":
-            parsed = parse_repo_arg(arg)
-            if not parsed:
-                print("[错误] 格式：add <owner/repo> 或 add <GitHub URL>")
+            # 支持一次添加多个仓库（空格分隔），全部解析成功后统一写入一次
+            parsed_list = [parse_repo_arg(a) for a in arg.split()]
+            if not parsed_list or not all(parsed_list):
+                print("[错误] 格式：add <owner/repo> 或 add <GitHub URL>，多个仓库以空格分隔")
                 print("  例如：add microsoft/vscode")
                 print("  例如：add https://github.com/microsoft/vscode")
                 continue
-            owner, repo = parsed
-            sub_manager = SubscriptionManager(config["subscriptions_file"])
-            sub_manager.add_subscription(owner, repo)
+            sub_manager.add_many(parsed_list)
 
         elif cmd == "remove":
             parsed = parse_repo_arg(arg)
@@ -171,18 +230,20 @@ def repl(config: dict):
                 print("[错误] 格式：remove <owner/repo> 或 remove <GitHub URL>")
                 continue
             owner, repo = parsed
-            sub_manager = SubscriptionManager(config["subscriptions_file"])
             sub_manager.remove_subscription(owner, repo)
 
         elif cmd == "run":
-            run_once(config)
+            run_once(config, sub_manager=sub_manager)
 
         elif cmd == "schedule":
-            start_schedule(config)
+            start_schedule(config, sub_manager=sub_manager)
 
         else:
             print(f"[未知命令] '{cmd}'，输入 help 查看可用命令")
 
+        # 命令结束时写回未保存的订阅变更
+        sub_manager.flush()
+
 
 if __name__ == "__main__":
     config = load_config()
@@ -1,26 +1,69 @@
+import time
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Iterable, Union
 
 
 class FileNotifier:
     """将报告保存为本地 Markdown 文件"""
 
+    WRITE_BUFFER_SIZE = 1 << 20  # 1 MiB
+    # 流式写入时累计超过以下字符数或间隔即刷新到磁盘，使生成中的报告内容及时落盘
+    STREAM_FLUSH_CHARS = 4096
+    STREAM_FLUSH_INTERVAL = 0.5  # 秒
+
     def __init__(self, output_dir: str):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
-    def _report_filename(self, prefix: str = "report") -> str:
-        ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-        return f"{prefix}_{ts}.md"
+    def _report_filename(self, prefix: str = "report", now: datetime = None) -> str:
+        if now is None:
+            now = datetime.now(timezone.utc)
+        return f"{prefix}_{now.strftime('%Y%m%d_%H%M%S')}.md"
+
+    def send(
+        self,
+        content: Union[str, Iterable[str]],
+        title: str = "GitHub Sentinel 报告",
+        repo_slug: str = "",
+    ) -> str:
+        """将报告内容写入 Markdown 文件，返回文件路径
 
-    def send(self, content: str, title: str = "GitHub Sentinel 报告", repo_slug: str = "") -> str:
-        """将报告内容写入 Markdown 文件，返回文件路径"""
+        content 可以是完整字符串，也可以是逐段产出的文本（如 LLM 流式输出），
+        后者边接收边写入；中途出错时删除未写完的文件并抛出异常。
+        """
         prefix = f"report_{repo_slug}" if repo_slug else "report"
-        filename = self._report_filename(prefix)
+        # 文件名与报告头共用同一时间戳，避免跨秒时两者不一致
+        now = datetime.now(timezone.utc)
+        filename = self._report_filename(prefix, now)
         file_path = self.output_dir / filename
 
-        header = f"# {title}\n\n生成时间：{datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}\n\n---\n\n"
-        file_path.write_text(header + content, encoding="utf-8")
+        header = f"# {title}\n\n生成时间：{now.strftime('%Y-%m-%d %H:%M:%S UTC')}\n\n---\n\n"
+        try:
+            # 报告头与正文分别写入大缓冲区，不再拼接出整份报告的临时字符串
+            with open(file_path, "w", encoding="utf-8", buffering=self.WRITE_BUFFER_SIZE) as f:
+                f.write(header)
+                if isinstance(content, str):
+                    f.write(content)
+                else:
+                    self._write_stream(f, content)
+        except BaseException:
+            file_path.unlink(missing_ok=True)
+            raise
 
         print(f"[通知] 报告已保存至：{file_path}")
         return str(file_path)
+
+    def _write_stream(self, f, chunks: Iterable[str]):
+        """逐段写入，按字符数或时间阈值分批刷新，避免报告结束前内容一直停留在缓冲区"""
+        f.flush()  # 报告头先落盘
+        pending = 0
+        last_flush = time.monotonic()
+        for chunk in chunks:
+            f.write(chunk)
+            pending += len(chunk)
+            now = time.monotonic()
+            if pending >= self.STREAM_FLUSH_CHARS or now - last_flush >= self.STREAM_FLUSH_INTERVAL:
+                f.flush()
+                pending = 0
+                last_flush = now
@@ -1,6 +1,6 @@
 import logging
 from typing import Callable
-from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 
 logger = logging.getLogger(__name__)
@@ -18,7 +18,8 @@ class SentinelScheduler:
         hour, minute = map(int, time_str.split(":"))
         self.hour = hour
         self.minute = minute
-        self._scheduler = BlockingScheduler()
+        # 调度器自带守护线程执行任务，调用方无需再额外创建线程
+        self._scheduler = BackgroundScheduler(daemon=True)
 
     def _build_trigger(self) -> CronTrigger:
         if self.interval == "weekly":
@@ -28,14 +29,21 @@ class SentinelScheduler:
             # 默认每日执行
             return CronTrigger(hour=self.hour, minute=self.minute)
 
+    @property
+    def running(self) -> bool:
+        return self._scheduler.running
+
     def start(self, job: Callable):
-        """注册任务并启动调度器（阻塞）"""
+        """注册任务并在后台启动调度器（立即返回）"""
         trigger = self._build_trigger()
         self._scheduler.add_job(job, trigger)
         schedule_desc = f"每{'周一' if self.interval == 'weekly' else '天'} {self.hour:02d}:{self.minute:02d}"
         logger.info(f"调度器已启动，执行频率：{schedule_desc}")
-        print(f"[调度器] 已启动，执行频率：{schedule_desc}（按 Ctrl+C 停止）")
-        try:
-            self._scheduler.start()
-        except (KeyboardInterrupt, SystemExit):
-            print("\n[调度器] 已停止")
+        print(f"[调度器] 已启动，执行频率：{schedule_desc}")
+        self._scheduler.start()
+
+    def shutdown(self):
+        """停止调度器，不等待正在执行的任务"""
+        if self._scheduler.running:
+            self._scheduler.shutdown(wait=False)
+            print("[调度器] 已停止")
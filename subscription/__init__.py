@@ -1,4 +1,4 @@
 """subscription 包"""
-from .manager import SubscriptionManager
+from .manager import SubscriptionManager, parse_repo_arg
 
-__all__ = ["SubscriptionManager"]
+__all__ = ["SubscriptionManager", "parse_repo_arg"]
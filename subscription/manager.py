@@ -1,6 +1,28 @@
-import json
+import os
+import re
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+
+import orjson
+
+from utils import atomic_write
+
+_RE_GITHUB_URL = re.compile(r"github\.com/([^/]+)/([^/\s]+)")
+_RE_OWNER_REPO = re.compile(r"^([A-Za-z0-9._-]+)/([A-Za-z0-9._-]+)$")
+
+
+def parse_repo_arg(arg: str) -> Optional[Tuple[str, str]]:
+    """解析 owner/repo 或完整 GitHub URL，返回 (owner, repo) 或 None；命令行与 Web 界面共用"""
+    arg = arg.strip()
+    # 匹配完整 URL：https://github.com/owner/repo 或 github.com/owner/repo
+    match = _RE_GITHUB_URL.search(arg)
+    if match:
+        return match.group(1), match.group(2).rstrip("/")
+    # 匹配 owner/repo 格式（允许首尾斜杠，仅允许 GitHub 用户名/仓库名中的合法字符）
+    match = _RE_OWNER_REPO.match(arg.strip("/"))
+    if match:
+        return match.group(1), match.group(2)
+    return None
 
 
 class SubscriptionManager:
@@ -9,31 +31,72 @@ class SubscriptionManager:
     def __init__(self, subscriptions_file: str):
         self.file_path = Path(subscriptions_file)
         self._data = self._load()
+        self._dirty = False  # 内存中有未写回磁盘的变更
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        # (owner, repo) -> 订阅条目，用于 O(1) 查重与查找
+        self._index: Dict[Tuple[str, str], Dict] = {
+            (s["owner"], s["repo"]): s for s in self._data.setdefault("subscriptions", [])
+        }
+
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.file_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
 
     def _load(self) -> dict:
-        if not self.file_path.exists():
+        # 先取 mtime 再读取，读取期间若文件被改写，下次检查时会再次加载
+        self._mtime = self._file_mtime()
+        if self._mtime is None:
             return {"subscriptions": []}
-        with open(self.file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return orjson.loads(self.file_path.read_bytes())
 
-    def _save(self):
-        self.file_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.file_path, "w", encoding="utf-8") as f:
-            json.dump(self._data, f, ensure_ascii=False, indent=2)
+    def _maybe_reload(self):
+        """订阅文件被其他进程修改（mtime 变化）时重新加载；有未保存的变更时不覆盖内存数据"""
+        if self._dirty or self._file_mtime() == self._mtime:
+            return
+        self._data = self._load()
+        self._rebuild_index()
+
+    def _flush(self):
+        if not self._dirty:
+            return
+        # 原子写入，避免写入中断或并发写入导致订阅文件损坏
+        atomic_write(
+            self.file_path,
+            orjson.dumps(self._data, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE),
+            fsync=True,
+        )
+        self._mtime = self._file_mtime()
+        self._dirty = False
+
+    def flush(self):
+        """将未保存的变更写回订阅文件（无变更时不做任何操作）"""
+        self._flush()
 
     def list_subscriptions(self) -> List[Dict]:
+        self._maybe_reload()
         return self._data.get("subscriptions", [])
 
-    def add_subscription(self, owner: str, repo: str, label: str = "", track: List[str] = None):
-        """添加仓库订阅"""
+    def get_subscription(self, owner: str, repo: str) -> Optional[Dict]:
+        """按 owner/repo 查找订阅，不存在时返回 None"""
+        self._maybe_reload()
+        return self._index.get((owner, repo))
+
+    def add_subscription(
+        self, owner: str, repo: str, label: str = "", track: List[str] = None, flush: bool = True
+    ) -> bool:
+        """添加仓库订阅，返回是否新增成功；flush=False 时仅修改内存，需稍后调用 flush()"""
         if track is None:
             track = ["releases", "issues", "pull_requests"]
 
+        self._maybe_reload()
         # 检查是否已存在
-        for sub in self._data["subscriptions"]:
-            if sub["owner"] == owner and sub["repo"] == repo:
-                print(f"[已存在] {owner}/{repo} 已在订阅列表中")
-                return
+        if (owner, repo) in self._index:
+            print(f"[已存在] {owner}/{repo} 已在订阅列表中")
+            return False
 
         entry = {
             "owner": owner,
@@ -42,20 +105,32 @@ class SubscriptionManager:
             "track": track,
         }
         self._data["subscriptions"].append(entry)
-        self._save()
+        self._index[(owner, repo)] = entry
+        self._dirty = True
+        if flush:
+            self._flush()
         print(f"[已添加] {owner}/{repo}")
+        return True
 
-    def remove_subscription(self, owner: str, repo: str):
-        """移除仓库订阅"""
-        original = self._data["subscriptions"]
-        self._data["subscriptions"] = [
-            s for s in original if not (s["owner"] == owner and s["repo"] == repo)
-        ]
-        if len(self._data["subscriptions"]) < len(original):
-            self._save()
-            print(f"[已移除] {owner}/{repo}")
-        else:
+    def remove_subscription(self, owner: str, repo: str, flush: bool = True) -> bool:
+        """移除仓库订阅，返回是否移除成功；flush=False 时仅修改内存，需稍后调用 flush()"""
+        self._maybe_reload()
+        entry = self._index.pop((owner, repo), None)
+        if entry is None:
             print(f"[未找到] {owner}/{repo} 不在订阅列表中")
+            return False
+        self._data["subscriptions"] = [s for s in self._data["subscriptions"] if s is not entry]
+        self._dirty = True
+        if flush:
+            self._flush()
+        print(f"[已移除] {owner}/{repo}")
+        return True
+
+    def add_many(self, owner_repo_list: List[Tuple[str, str]]) -> int:
+        """批量添加订阅，全部处理完后只写一次文件，返回新增数量"""
+        added = sum(self.add_subscription(owner, repo, flush=False) for owner, repo in owner_repo_list)
+        self._flush()
+        return added
 
     def display(self):
         """打印当前订阅列表"""
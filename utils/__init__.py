@@ -0,0 +1,4 @@
+"""utils 包"""
+from .fs import atomic_write
+
+__all__ = ["atomic_write"]
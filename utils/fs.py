@@ -0,0 +1,26 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import Union
+
+
+def atomic_write(path: Union[str, Path], data: bytes, fsync: bool = False):
+    """先写入同目录下的唯一临时文件再原子替换目标文件
+
+    临时文件由 mkstemp 生成，多个线程或进程同时写同一目标时互不干扰，
+    读取方只会看到旧文件或完整的新文件。fsync=True 时在替换前将数据刷到磁盘。
+    失败时删除临时文件并抛出异常。
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise